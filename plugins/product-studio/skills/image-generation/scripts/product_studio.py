@@ -1,12 +1,13 @@
 # /// script
 # requires-python = ">=3.10"
 # dependencies = [
-#     "tavily-python",
-#     "requests",
 #     "google-genai",
 #     "pillow",
 #     "anthropic",
-#     "httpx[socks]",
+#     "httpx[socks,http2]",
+#     "pybase64",
+#     "orjson",
+#     "pyoxipng",
 # ]
 # ///
 """
@@ -24,15 +25,90 @@ Usage:
 """
 
 import argparse
+import asyncio
 import base64
+import hashlib
+import importlib.util
 import io
+import itertools
 import json
+import multiprocessing
 import os
+import random
+import socket
+import struct
 import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+    import anthropic
+    from google import genai
+
+# Hot-path dependencies are imported once here; a missing one is reported by
+# check_dependencies() during preflight rather than as a NameError mid-run.
+# The SDKs stay imported lazily: they take ~1s to load, and the spawned
+# optimization workers re-import this module.
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import oxipng
+except ImportError:
+    oxipng = None
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used when running outside uv
+    orjson = None
+
+
+def _module_available(name: str) -> bool:
+    """Whether a module can be imported, without importing it."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def check_dependencies(optimize_png: bool = False) -> list[str]:
+    """Names of required packages that are not installed."""
+    missing = [
+        name for name, module in (("httpx", httpx), ("pybase64", pybase64), ("pillow", Image))
+        if module is None
+    ]
+    if optimize_png and oxipng is None:
+        missing.append("pyoxipng")
+    missing += [
+        name for name, module in (("anthropic", "anthropic"), ("google-genai", "google.genai"))
+        if not _module_available(module)
+    ]
+    return missing
+
+
+def _json_loads(data: bytes | str):
+    """Parse JSON with orjson when available (much faster on large base64 bodies)."""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj, indent: bool = False) -> str:
+    """Serialize to JSON with orjson when available, optionally indented by 2."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(obj, indent=2 if indent else None)
 
 
 @dataclass
@@ -44,14 +120,14 @@ class GenerationResult:
     token_usage: dict[str, int] = field(default_factory=dict)
     message: str = ""
 
-    def to_json(self) -> str:
-        return json.dumps({
+    def to_json(self, pretty: bool = False) -> str:
+        return _json_dumps({
             "status": self.status,
             "files": self.files,
             "reference_images": self.reference_images,
             "token_usage": self.token_usage,
             "message": self.message
-        }, indent=2)
+        }, indent=pretty)
 
 
 @dataclass
@@ -62,6 +138,406 @@ class ImageCandidate:
     image_data: Optional[bytes] = None
     matched_details: Optional[str] = None  # Haiku's analysis of how image matches subject
     confidence_score: float = 0.0
+    optimized: dict[int, tuple[str, bytes]] = field(default_factory=dict)  # max_dimension -> (mime, data)
+
+
+# Forced tool call so Haiku returns already-parsed scores
+_SCORE_IMAGES_TOOL = {
+    "name": "score_images",
+    "description": "Record how well each reference image matches the subject.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "scores": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "index": {"type": "integer"},
+                        "confidence_score": {"type": "number", "minimum": 0, "maximum": 10},
+                        "matched_details": {"type": "string"}
+                    },
+                    "required": ["index", "confidence_score", "matched_details"]
+                }
+            }
+        },
+        "required": ["scores"]
+    }
+}
+
+_SCRAPENINJA_URL = "https://scrapeninja.p.rapidapi.com/scrape"
+_SCRAPENINJA_PAYLOAD_BASE = {"method": "GET", "retryNum": 1, "geo": "us"}
+
+_BROWSER_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/126.0 Safari/537.36"
+)
+
+# Formats accepted as-is by both Claude and Gemini
+_PASSTHROUGH_MIME_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+
+# First four bytes -> (offset, remaining signature, extension)
+_FORMAT_BY_PREFIX = {
+    b'\x89PNG': (4, b'\r\n\x1a\n', ".png"),
+    b'RIFF': (8, b'WEBP', ".webp"),
+    b'GIF8': (4, b'', ".gif"),
+}
+# ISO-BMFF "ftyp" box + major brand at bytes 4-12
+_FORMAT_BY_FTYP_BRAND = {
+    b'ftypavif': ".avif",
+    b'ftypavis': ".avif",
+    b'ftypheic': ".heic",
+    b'ftypmif1': ".heic",
+}
+
+
+def _detect_image_format(image_data: bytes) -> str:
+    """Detect image format from magic bytes."""
+    if len(image_data) < 12:
+        return ".bin"
+
+    # startswith() compares in place, without allocating slices.
+    # JPEG's fourth byte varies by segment type, so it is matched on three.
+    if image_data.startswith(b'\xff\xd8\xff'):
+        return ".jpg"
+
+    entry = _FORMAT_BY_PREFIX.get(image_data[:4])
+    if entry:
+        offset, tail, ext = entry
+        return ext if image_data.startswith(tail, offset) else ".bin"
+    return _FORMAT_BY_FTYP_BRAND.get(image_data[4:12], ".bin")
+
+
+def _is_complete(image_data: bytes, ext: str) -> bool:
+    """Whether a JPEG/PNG/WebP file ends where its format says it should.
+
+    Catches truncated downloads, which the header alone doesn't reveal.
+    """
+    if ext == ".jpg":
+        return image_data.rstrip(b'\x00').endswith(b'\xff\xd9')
+    if ext == ".png":
+        return image_data.endswith(b'IEND\xaeB`\x82')
+    if ext == ".webp":
+        return len(image_data) >= 8 + int.from_bytes(image_data[4:8], "little")
+    return False
+
+
+def _may_have_alpha(image_data: bytes, ext: str) -> bool:
+    """Whether a PNG/WebP can carry transparency, judged from its header.
+
+    Any PNG may (tRNS can appear on any color type). Lossless WebP (VP8L)
+    is treated the same way; extended WebP (VP8X) declares alpha in a flag.
+    """
+    if ext == ".png":
+        return True
+    if ext == ".webp":
+        chunk = image_data[12:16]
+        if chunk == b'VP8X':
+            # A header too short to hold the flags byte is assumed to have alpha
+            return len(image_data) <= 20 or bool(image_data[20] & 0x10)
+        return chunk == b'VP8L'
+    return False
+
+
+def _read_dimensions(image_data: bytes, ext: str) -> Optional[tuple[int, int]]:
+    """Read (width, height) from a JPEG/PNG/WebP header without decoding.
+
+    Returns None for anything that shouldn't be passed through untouched
+    (truncated files, CMYK or non-baseline/progressive JPEGs, animated WebP)
+    or can't be parsed.
+    """
+    if not _is_complete(image_data, ext):
+        return None
+    try:
+        if ext == ".png":
+            if image_data.startswith(b'IHDR', 12):
+                return struct.unpack(">II", image_data[16:24])
+        elif ext == ".jpg":
+            i = 2
+            while i + 9 < len(image_data):
+                if image_data[i] != 0xFF:
+                    return None
+                marker = image_data[i + 1]
+                if marker == 0xFF:
+                    i += 1
+                    continue
+                if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                    i += 2
+                    continue
+                # Only 8-bit baseline, extended sequential and progressive
+                # Huffman (SOF0-2); 12-bit, lossless, hierarchical and
+                # arithmetic are rejected
+                if marker in (0xC0, 0xC1, 0xC2):
+                    if image_data[i + 4] != 8:
+                        return None
+                    height, width = struct.unpack(">HH", image_data[i + 5:i + 9])
+                    return (width, height) if image_data[i + 9] in (1, 3) else None
+                if 0xC3 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    return None
+                i += 2 + struct.unpack(">H", image_data[i + 2:i + 4])[0]
+        elif ext == ".webp":
+            chunk = image_data[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack("<HH", image_data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            elif chunk == b'VP8L':
+                bits = struct.unpack("<I", image_data[21:25])[0]
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            elif chunk == b'VP8X' and not image_data[20] & 0x02:
+                width = int.from_bytes(image_data[24:27], "little") + 1
+                height = int.from_bytes(image_data[27:30], "little") + 1
+                return width, height
+    except (IndexError, struct.error):
+        pass
+    return None
+
+
+def _encode_image(img: "Image.Image", prefer_jpeg: bool = True) -> tuple[str, bytes]:
+    """Encode as JPEG, flattening transparency onto white.
+
+    With prefer_jpeg=False, images with transparency are kept as PNG instead.
+    """
+    buffer = io.BytesIO()
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        if not prefer_jpeg:
+            img.save(buffer, format="PNG", optimize=True)
+            return "image/png", buffer.getvalue()
+        # Product shots are mostly catalog cut-outs, so the alpha is incidental
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", img.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    # 4:2:0 chroma subsampling + optimized Huffman tables; uses libjpeg-turbo's SIMD DCT
+    img.convert("RGB").save(
+        buffer, format="JPEG", quality=85, optimize=True, progressive=False, subsampling=2
+    )
+    return "image/jpeg", buffer.getvalue()
+
+
+def _optimize_image_vips(
+    image_data: bytes,
+    max_dimensions: tuple[int, ...],
+    prefer_jpeg: bool = True
+) -> dict[int, tuple[str, bytes]]:
+    """Decode, shrink and encode in one libvips call per size.
+
+    thumbnail_buffer shrinks on load, so the full-resolution raster is never
+    materialized and peak memory stays low.
+    """
+    import pyvips
+
+    results = {}
+    for max_dimension in max_dimensions:
+        img = pyvips.Image.thumbnail_buffer(image_data, max_dimension, height=max_dimension, size="down")
+        if img.hasalpha() and not prefer_jpeg:
+            results[max_dimension] = ("image/png", img.write_to_buffer(".png"))
+        else:
+            if img.hasalpha():
+                img = img.flatten(background=[255, 255, 255])
+            results[max_dimension] = (
+                "image/jpeg",
+                img.write_to_buffer(".jpg", Q=85, optimize_coding=True, subsample_mode="on")
+            )
+    return results
+
+
+def _optimize_image(
+    image_data: bytes,
+    max_dimensions: tuple[int, ...] = (3072,),
+    prefer_jpeg: bool = True
+) -> dict[int, tuple[str, bytes]]:
+    """Optimize image for API processing at one or more max dimensions.
+
+    Sizes the source already fits are returned as the original bytes when the
+    format is accepted by both APIs. With prefer_jpeg, PNGs and WebPs that
+    may carry alpha are re-encoded instead, so transparency gets flattened.
+    Otherwise the source is decoded once; smaller sizes are downscaled from
+    the larger raster rather than re-decoded. Returns {} if the image cannot
+    be decoded.
+
+    Set PRODUCT_STUDIO_USE_VIPS=1 to resize with libvips instead of PIL
+    (requires pyvips, e.g. `uv run --with "pyvips[binary]" ...`).
+    """
+    results = {}
+    ext = _detect_image_format(image_data)
+    if ext in _PASSTHROUGH_MIME_TYPES and not (prefer_jpeg and _may_have_alpha(image_data, ext)):
+        size = _read_dimensions(image_data, ext)
+        if size:
+            for max_dimension in max_dimensions:
+                if max(size) <= max_dimension:
+                    results[max_dimension] = (_PASSTHROUGH_MIME_TYPES[ext], image_data)
+
+    max_dimensions = tuple(d for d in max_dimensions if d not in results)
+    if not max_dimensions:
+        return results
+
+    if os.environ.get("PRODUCT_STUDIO_USE_VIPS") == "1":
+        try:
+            results.update(_optimize_image_vips(image_data, max_dimensions, prefer_jpeg))
+            return results
+        except ImportError:
+            print("Warning: PRODUCT_STUDIO_USE_VIPS=1 but pyvips is not installed, using PIL", file=sys.stderr)
+        except Exception as e:
+            print(f"Warning: libvips optimization failed ({e}), using PIL", file=sys.stderr)
+
+    try:
+        largest = max(max_dimensions)
+        img = Image.open(io.BytesIO(image_data))
+        # draft() must precede any pixel access: libjpeg then decodes JPEGs at
+        # 1/2, 1/4 or 1/8 scale, so the full-resolution raster is never held.
+        # It is a no-op for other formats.
+        img.draft('RGB', (largest, largest))
+        img.load()
+
+        for max_dimension in sorted(max_dimensions, reverse=True):
+            if max(img.size) > max_dimension:
+                img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            results[max_dimension] = _encode_image(img, prefer_jpeg)
+        return results
+    except Exception as e:
+        print(f"Warning: Image optimization failed ({e})", file=sys.stderr)
+        return results
+
+
+def _optimize_shared_image(
+    shm_name: str,
+    size: int,
+    max_dimensions: tuple[int, ...],
+    prefer_jpeg: bool = True
+) -> dict[int, tuple[str, bytes]]:
+    """Worker entry point: optimize image bytes read from a shared memory block."""
+    shm = SharedMemory(name=shm_name)
+    try:
+        image_data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    return _optimize_image(image_data, max_dimensions, prefer_jpeg)
+
+
+def _optimize_images(
+    images: list[bytes],
+    max_dimensions: tuple[int, ...] = (3072,),
+    prefer_jpeg: bool = True
+) -> list[dict[int, tuple[str, bytes]]]:
+    """Optimize several images in parallel worker processes, preserving order.
+
+    Source bytes are handed over through shared memory rather than pickled
+    through the pool's pipe.
+    """
+    max_workers = min(len(images), os.cpu_count() or 1)
+    # A one-process pool only adds spawn and re-import cost
+    if max_workers <= 1:
+        return [_optimize_image(image_data, max_dimensions, prefer_jpeg) for image_data in images]
+
+    buffers: list[SharedMemory] = []
+    try:
+        for image_data in images:
+            shm = SharedMemory(create=True, size=max(len(image_data), 1))
+            buffers.append(shm)
+            shm.buf[:len(image_data)] = image_data
+
+        # spawn, not fork: the parent already runs threads (fetch-time optimization,
+        # libvips' worker pool) and forking those can deadlock the children
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            return list(executor.map(
+                _optimize_shared_image,
+                [shm.name for shm in buffers],
+                [len(image_data) for image_data in images],
+                [max_dimensions] * len(images),
+                [prefer_jpeg] * len(images)
+            ))
+    finally:
+        for shm in buffers:
+            shm.close()
+            shm.unlink()
+
+
+def _ensure_optimized(
+    candidates: list[ImageCandidate],
+    max_dimensions: tuple[int, ...],
+    prefer_jpeg: bool = True
+) -> None:
+    """Fill in each candidate's optimized cache for the sizes it is missing.
+
+    Sizes already produced (e.g. at fetch time) are never recomputed, and all
+    of a candidate's missing sizes come from a single decode.
+    """
+    pending: dict[tuple[int, ...], list[ImageCandidate]] = {}
+    for candidate in candidates:
+        missing = tuple(d for d in max_dimensions if d not in candidate.optimized)
+        if candidate.image_data and missing:
+            pending.setdefault(missing, []).append(candidate)
+
+    for missing, group in pending.items():
+        for candidate, optimized in zip(group, _optimize_images([c.image_data for c in group], missing, prefer_jpeg)):
+            candidate.optimized.update(optimized)
+
+
+def _write_file(filepath: Path, data: bytes) -> None:
+    """Write bytes with raw os.write calls (no buffered file object), fsynced before close."""
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class OutputWriter:
+    """Writes generated and reference images on background threads as they arrive."""
+
+    def __init__(self, output_dir: str, optimize_png: bool = False):
+        self.output_path = Path(output_dir)
+        self.optimize_png = optimize_png
+        self.refs_path = self.output_path / ".refs"
+        self.refs_path.mkdir(exist_ok=True)
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.generated_files: list[str] = []
+        self.ref_files: list[str] = []
+        # File writes release the GIL, so they overlap in threads
+        self._executor = ThreadPoolExecutor(max_workers=8)
+        self._pending: list[Future] = []
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add_generated(self, img_data: bytes) -> None:
+        """Queue a generated image for writing."""
+        filepath = self.output_path / f"product_{self.timestamp}_{len(self.generated_files)}.png"
+        write = self._write_optimized_png if self.optimize_png else _write_file
+        self._pending.append(self._executor.submit(write, filepath, img_data))
+        self.generated_files.append(str(filepath))
+
+    @staticmethod
+    def _write_optimized_png(filepath: Path, img_data: bytes) -> None:
+        """Losslessly recompress a PNG with oxipng (releases the GIL) before writing."""
+        if _detect_image_format(img_data) == ".png":
+            img_data = oxipng.optimize_from_memory(img_data, level=2)
+        _write_file(filepath, img_data)
+
+    def add_reference(self, ref: ImageCandidate) -> None:
+        """Queue a reference image for writing, named by its detected format."""
+        if ref.image_data:
+            ext = _detect_image_format(ref.image_data)
+            filepath = self.refs_path / f"ref_{self.timestamp}_{len(self.ref_files)}{ext}"
+            self._pending.append(self._executor.submit(_write_file, filepath, ref.image_data))
+            self.ref_files.append(str(filepath))
+
+    def close(self) -> None:
+        """Wait for all queued writes, re-raising the first failure."""
+        try:
+            for future in self._pending:
+                future.result()
+        finally:
+            self._executor.shutdown()
 
 
 class ProductStudio:
@@ -69,13 +545,73 @@ class ProductStudio:
 
     VALID_RESOLUTIONS = {"1k", "2k", "4k"}
     VALID_ASPECT_RATIOS = {"1:1", "4:3", "3:4", "16:9", "9:16", "21:9", "3:2", "2:3"}
-
-    def __init__(self, debug: bool = False):
+    FETCH_WORKERS = 10  # enough to fetch every Tavily result at once
+    MAX_REFERENCE_IMAGES = 3
+    MAX_IMAGE_BYTES = 20 * 1024 * 1024  # direct downloads larger than this are abandoned
+    RETRY_MAX_ATTEMPTS = 5
+    RETRY_BASE_DELAY = 0.5  # seconds; doubles per attempt
+    RETRY_MAX_DELAY = 8.0
+    RETRY_AFTER_MAX_DELAY = 30.0  # cap on server-requested Retry-After waits
+    RETRY_STATUSES = {429, 500, 502, 503, 529}
+    SELECT_MAX_DIMENSION = 1024
+    GENERATE_MAX_DIMENSION = 3072
+    API_TIMEOUT = 120.0  # seconds, per Anthropic/Gemini request
+    CACHE_TTL_DAYS = 7.0
+
+    def __init__(
+        self,
+        debug: bool = False,
+        optimize_png: bool = False,
+        cache_ttl_days: float = CACHE_TTL_DAYS,
+        validate_keys: bool = False,
+        prefer_jpeg: bool = True
+    ):
         self.tavily_key = os.environ.get("TAVILY_API_KEY")
         self.scrapeninja_key = os.environ.get("SCRAPENINJA_API_KEY")
         self.gemini_key = os.environ.get("GEMINI_API_KEY")
         self.anthropic_key = os.environ.get("ANTHROPIC_API_KEY")
         self.debug = debug
+        self.optimize_png = optimize_png
+        self.cache_ttl_days = cache_ttl_days
+        self.validate_keys = validate_keys
+        self.prefer_jpeg = prefer_jpeg
+        self._scrapeninja_headers = {
+            "content-type": "application/json",
+            "X-RapidAPI-Key": self.scrapeninja_key,
+            "X-RapidAPI-Host": "scrapeninja.p.rapidapi.com"
+        }
+        self._anthropic = None
+        self._gemini = None
+
+    @property
+    def anthropic_client(self) -> "anthropic.Anthropic":
+        """Anthropic client, created on first use and reused for its connection pool."""
+        if self._anthropic is None:
+            import anthropic
+
+            self._anthropic = anthropic.Anthropic(
+                api_key=self.anthropic_key,
+                http_client=anthropic.DefaultHttpxClient(http2=True),
+                timeout=self.API_TIMEOUT,
+                max_retries=0  # _call_with_retry owns retries
+            )
+        return self._anthropic
+
+    @property
+    def gemini_client(self) -> "genai.Client":
+        """Gemini client, created on first use and reused for its connection pool."""
+        if self._gemini is None:
+            from google import genai
+            from google.genai import types
+
+            self._gemini = genai.Client(
+                api_key=self.gemini_key,
+                http_options=types.HttpOptions(
+                    timeout=int(self.API_TIMEOUT * 1000),  # milliseconds
+                    client_args={"http2": True}
+                )
+            )
+        return self._gemini
 
     def _debug_print(self, label: str, content: str):
         """Print debug info to stderr."""
@@ -86,10 +622,92 @@ class ProductStudio:
             print(content, file=sys.stderr)
             print(f"{'='*60}\n", file=sys.stderr)
 
-    def preflight_check(self, output_dir: str) -> tuple[bool, str]:
-        """Validate all prerequisites before starting."""
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Backoff before the next attempt: Retry-After if given, else exponential with jitter."""
+        if retry_after:
+            try:
+                return min(self.RETRY_AFTER_MAX_DELAY, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        delay = min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2 ** attempt)
+        return delay + random.uniform(0, self.RETRY_BASE_DELAY)
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """Whether an SDK error is a rate limit, overload, or connection failure."""
+        import anthropic
+
+        # anthropic exposes status_code, google-genai exposes code
+        status = getattr(error, "status_code", None) or getattr(error, "code", None)
+        if status in self.RETRY_STATUSES:
+            return True
+        return isinstance(error, (httpx.TransportError, anthropic.APIConnectionError))
+
+    def _call_with_retry(self, fn: Callable, *args, **kwargs):
+        """Call fn, retrying retryable errors with backoff."""
+        for attempt in range(self.RETRY_MAX_ATTEMPTS):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.RETRY_MAX_ATTEMPTS - 1 or not self._is_retryable(e):
+                    raise
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("retry-after") if response is not None else None
+                delay = self._retry_delay(attempt, retry_after)
+                print(f"  Retrying in {delay:.1f}s after error: {e}", file=sys.stderr)
+                time.sleep(delay)
+
+    async def _post_with_retry(self, client: "httpx.AsyncClient", url: str, **kwargs) -> "httpx.Response":
+        """POST, retrying transport errors and retryable statuses with backoff."""
+        for attempt in range(self.RETRY_MAX_ATTEMPTS):
+            last_attempt = attempt == self.RETRY_MAX_ATTEMPTS - 1
+            try:
+                response = await client.post(url, **kwargs)
+            except httpx.TransportError:
+                if last_attempt:
+                    raise
+                retry_after = None
+            else:
+                if last_attempt or response.status_code not in self.RETRY_STATUSES:
+                    return response
+                retry_after = response.headers.get("retry-after")
+            await asyncio.sleep(self._retry_delay(attempt, retry_after))
+
+    def _check_key(self, client: "httpx.Client", name: str, method: str, url: str, headers: dict) -> Optional[str]:
+        """Make one cheap authenticated request; an error message if the key or network is bad."""
+        try:
+            response = client.request(method, url, headers=headers)
+        except httpx.HTTPError as e:
+            return f"{name} unreachable: {e}"
+        # Providers disagree on the status for a bad key (Gemini answers 400
+        # API_KEY_INVALID), so any client error except a missing route counts
+        if 400 <= response.status_code < 500 and response.status_code not in (404, 405):
+            return f"{name} failed validation (HTTP {response.status_code})"
+        return None
+
+    def _validate_keys_live(self) -> list[str]:
+        """Check every provider's key in parallel, bounded at 10s each."""
+        checks = [
+            # /usage authenticates the key without spending search credits
+            ("TAVILY_API_KEY", "GET", "https://api.tavily.com/usage",
+             {"Authorization": f"Bearer {self.tavily_key}"}),
+            ("SCRAPENINJA_API_KEY", "GET", "https://scrapeninja.p.rapidapi.com/status",
+             self._scrapeninja_headers),
+            ("GEMINI_API_KEY", "GET", "https://generativelanguage.googleapis.com/v1beta/models",
+             {"x-goog-api-key": self.gemini_key}),
+            ("ANTHROPIC_API_KEY", "GET", "https://api.anthropic.com/v1/models",
+             {"x-api-key": self.anthropic_key, "anthropic-version": "2023-06-01"}),
+        ]
+        with httpx.Client(timeout=10.0) as client, ThreadPoolExecutor(max_workers=len(checks)) as executor:
+            futures = [executor.submit(self._check_key, client, *check) for check in checks]
+            return [error for future in futures if (error := future.result())]
+
+    def preflight_check(self, output_dir: str, validate_live: bool = False) -> tuple[bool, str]:
+        """Validate all prerequisites before starting, optionally checking keys against each API."""
         errors = []
 
+        missing = check_dependencies(self.optimize_png)
+        if missing:
+            errors.append(f"Missing packages: {', '.join(missing)}")
         if not self.tavily_key:
             errors.append("TAVILY_API_KEY not set")
         if not self.scrapeninja_key:
@@ -106,88 +724,224 @@ class ProductStudio:
         except Exception as e:
             errors.append(f"Cannot create output directory: {e}")
 
+        # Only worth a network round-trip once every key is present
+        if validate_live and not errors:
+            errors.extend(self._validate_keys_live())
+
         if errors:
             return False, "\n".join(f"- {e}" for e in errors)
         return True, ""
 
-    def search_images(self, query: str) -> list[ImageCandidate]:
-        """Step 1: Search for reference images using Tavily."""
-        from tavily import TavilyClient
-
-        client = TavilyClient(api_key=self.tavily_key)
-        response = client.search(
-            query=query,
-            include_images=True,
-            include_image_descriptions=True,
-            max_results=10
+    async def search_images(
+        self,
+        client: "httpx.AsyncClient",
+        query: str,
+        queue: asyncio.Queue
+    ) -> list[ImageCandidate]:
+        """Step 1: Search Tavily, streaming each candidate into the fetch queue."""
+        response = await self._post_with_retry(
+            client,
+            "https://api.tavily.com/search",
+            json={
+                "query": query,
+                "include_images": True,
+                "include_image_descriptions": True,
+                "max_results": 10
+            },
+            headers={"Authorization": f"Bearer {self.tavily_key}"},
+            timeout=30.0
         )
+        response.raise_for_status()
 
+        # Tavily often lists the same image under several result pages
         candidates = []
-        for img in response.get("images", []):
+        seen_urls = set()
+        for img in _json_loads(response.content).get("images", []):
             if isinstance(img, dict):
-                candidates.append(ImageCandidate(
+                candidate = ImageCandidate(
                     url=img.get("url", ""),
                     description=img.get("description")
-                ))
+                )
             elif isinstance(img, str):
-                candidates.append(ImageCandidate(url=img, description=None))
+                candidate = ImageCandidate(url=img, description=None)
+            else:
+                continue
+
+            if candidate.url in seen_urls:
+                continue
+            seen_urls.add(candidate.url)
+            candidates.append(candidate)
+            if candidate.url:
+                queue.put_nowait(candidate)
 
         return candidates
 
-    def fetch_image(self, image_url: str) -> Optional[bytes]:
-        """Fetch a single image through ScrapeNinja proxy."""
-        import requests
+    async def _fetch_direct(self, client: "httpx.AsyncClient", image_url: str) -> Optional[bytes]:
+        """Download an image straight from its host.
 
-        payload = {
-            "url": image_url,
-            "method": "GET",
-            "retryNum": 1,
-            "geo": "us"
-        }
-        headers = {
-            "content-type": "application/json",
-            "X-RapidAPI-Key": self.scrapeninja_key,
-            "X-RapidAPI-Host": "scrapeninja.p.rapidapi.com"
-        }
+        Returns None if the host blocks us, doesn't serve an image, or sends
+        more than MAX_IMAGE_BYTES.
+        """
+        try:
+            async with client.stream(
+                "GET",
+                image_url,
+                headers={"User-Agent": _BROWSER_USER_AGENT},
+                timeout=10.0,
+                follow_redirects=True
+            ) as response:
+                if response.status_code != 200:
+                    return None
+                if not response.headers.get("content-type", "").startswith("image/"):
+                    return None
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > self.MAX_IMAGE_BYTES:
+                        return None
+                    chunks.append(chunk)
+                return b"".join(chunks)
+        except (httpx.HTTPError, httpx.InvalidURL):
+            return None
+
+    async def _fetch_one(self, client: "httpx.AsyncClient", image_url: str) -> Optional[bytes]:
+        """Fetch a single image, directly when the host allows it, else through ScrapeNinja proxy.
+
+        The direct path avoids the proxy's base64-in-JSON body entirely.
+        """
+        image_data = await self._fetch_direct(client, image_url)
+        if image_data:
+            return image_data
 
         try:
-            response = requests.post(
-                "https://scrapeninja.p.rapidapi.com/scrape",
-                json=payload,
-                headers=headers,
-                timeout=30
+            response = await self._post_with_retry(
+                client,
+                _SCRAPENINJA_URL,
+                json={"url": image_url, **_SCRAPENINJA_PAYLOAD_BASE},
+                headers=self._scrapeninja_headers,
+                timeout=30.0
             )
-            response_json = response.json()
+            if response.status_code != 200:
+                print(f"Warning: Failed to fetch {image_url}: HTTP {response.status_code}", file=sys.stderr)
+                return None
+            response_json = _json_loads(response.content)
             if "body" in response_json:
                 return base64.b64decode(response_json["body"])
         except Exception as e:
             print(f"Warning: Failed to fetch {image_url}: {e}", file=sys.stderr)
         return None
 
-    def fetch_all_images(self, candidates: list[ImageCandidate]) -> list[ImageCandidate]:
-        """Step 2: Fetch all candidate images."""
-        fetched = []
-        for candidate in candidates:
-            if candidate.url:
-                image_data = self.fetch_image(candidate.url)
-                if image_data:
+    def _http_client(self) -> "httpx.AsyncClient":
+        """Create the pooled keep-alive client shared by Tavily and ScrapeNinja requests."""
+        transport = httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(
+                # One per fetch worker plus one for the Tavily search
+                max_connections=self.FETCH_WORKERS + 1,
+                max_keepalive_connections=self.FETCH_WORKERS + 1,
+                keepalive_expiry=60.0
+            ),
+            # TCP keep-alive so idle pooled connections aren't silently dropped
+            socket_options=[(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        )
+        return httpx.AsyncClient(transport=transport)
+
+    async def search_and_fetch(
+        self,
+        query: str,
+        optimize_dimensions: tuple[int, ...] = (),
+        target_fetches: Optional[int] = None
+    ) -> tuple[list[ImageCandidate], list[ImageCandidate]]:
+        """Steps 1-2: Search and fetch as one pipeline.
+
+        Fetch workers consume candidates as soon as the search parses them.
+        Each fetched image is then optimized for optimize_dimensions on a
+        thread, overlapping the remaining downloads. With target_fetches, only
+        the first that many distinct images to arrive are kept; once they are
+        optimized, outstanding fetches are cancelled.
+        Returns all candidates and the successfully fetched ones, in search order.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        enough = asyncio.Event()
+        # Mirrored copies of the same image are dropped as they arrive
+        seen_digests = set()
+        ready = 0
+        optimizing: set[asyncio.Task] = set()
+
+        async def optimize(candidate: ImageCandidate) -> None:
+            # Pillow releases the GIL while decoding and resampling
+            candidate.optimized.update(await asyncio.to_thread(
+                _optimize_image, candidate.image_data, optimize_dimensions, self.prefer_jpeg
+            ))
+
+        async with self._http_client() as client:
+
+            async def worker():
+                nonlocal ready
+                while True:
+                    candidate = await queue.get()
+                    if candidate is None:
+                        return
+                    image_data = await self._fetch_one(client, candidate.url)
+                    if not image_data:
+                        continue
+                    digest = hashlib.sha256(image_data).digest()
+                    if digest in seen_digests:
+                        continue
+                    if target_fetches and len(seen_digests) >= target_fetches:
+                        continue  # already have enough; don't start optimizing extras
+                    seen_digests.add(digest)
                     candidate.image_data = image_data
-                    fetched.append(candidate)
-        return fetched
+                    if optimize_dimensions:
+                        task = asyncio.create_task(optimize(candidate))
+                        optimizing.add(task)
+                        # Shielded: cancelling this worker must not discard the result
+                        await asyncio.shield(task)
+                    ready += 1
+                    if target_fetches and ready >= target_fetches:
+                        enough.set()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.FETCH_WORKERS)]
+            try:
+                candidates = await self.search_images(client, query, queue)
+                for _ in workers:
+                    queue.put_nowait(None)
+
+                # Wait for every worker to drain the queue, or for enough images
+                all_done = asyncio.create_task(asyncio.wait(workers))
+                enough_wait = asyncio.create_task(enough.wait())
+                await asyncio.wait({all_done, enough_wait}, return_when=asyncio.FIRST_COMPLETED)
+                all_done.cancel()
+                enough_wait.cancel()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                await asyncio.gather(*optimizing, return_exceptions=True)
+
+        fetched = [c for c in candidates if c.image_data]
+        return candidates, fetched
 
     def select_best_images(
         self,
         candidates: list[ImageCandidate],
         subject: str,
-        min_score: float = 7.0
+        min_score: float = 7.0,
+        max_images: int = 3
     ) -> list[ImageCandidate]:
-        """Step 3: Use Claude Haiku to score and analyze reference images."""
-        import anthropic
+        """Step 3: Use Claude Haiku to score and analyze reference images.
 
+        Returns at most max_images candidates. When no more than that were
+        fetched there is nothing to choose between, so Haiku is not called.
+        """
         if not candidates:
             return []
 
-        client = anthropic.Anthropic(api_key=self.anthropic_key)
+        if len([c for c in candidates if c.image_data]) <= max_images:
+            return [c for c in candidates if c.image_data]
+
+        client = self.anthropic_client
 
         content = [{
             "type": "text",
@@ -196,39 +950,41 @@ class ProductStudio:
 For EACH image, provide:
 - confidence_score: 0-10 (how well it matches the subject)
 - matched_details: what specific elements in the image match the subject
-
-Respond with ONLY a JSON array:
-[
-  {{"index": 0, "confidence_score": 9, "matched_details": "Shows exploded view with labeled bracket, runner, and locking device"}},
-  {{"index": 1, "confidence_score": 3, "matched_details": "Only shows packaging, not the actual product"}}
-]
+  (e.g. "Shows exploded view with labeled bracket, runner, and locking device"
+  or "Only shows packaging, not the actual product")
 """
         }]
 
+        # Also encode the generation size now, so winners aren't decoded twice
+        _ensure_optimized(
+            candidates,
+            (self.GENERATE_MAX_DIMENSION, self.SELECT_MAX_DIMENSION),
+            self.prefer_jpeg
+        )
+
         valid_indices = []
         for i, candidate in enumerate(candidates):
-            if candidate.image_data:
-                mime_type, optimized_data = self._optimize_image(candidate.image_data, max_dimension=1024)
-                if mime_type is None:
-                    continue
-
-                content.append({
-                    "type": "text",
-                    "text": f"\n--- Image {len(valid_indices)} ---\nDescription: {candidate.description or 'None'}\n"
-                })
-                content.append({
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": mime_type,
-                        "data": base64.b64encode(optimized_data).decode()
-                    }
-                })
-                valid_indices.append(i)
+            if self.SELECT_MAX_DIMENSION not in candidate.optimized:
+                continue
+            mime_type, optimized_data = candidate.optimized[self.SELECT_MAX_DIMENSION]
+
+            content.append({
+                "type": "text",
+                "text": f"\n--- Image {len(valid_indices)} ---\nDescription: {candidate.description or 'None'}\n"
+            })
+            content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": mime_type,
+                    "data": pybase64.b64encode_as_string(optimized_data)
+                }
+            })
+            valid_indices.append(i)
 
         content.append({
             "type": "text",
-            "text": "\nRespond with ONLY the JSON array, no other text:"
+            "text": "\nRecord a score for every image with the score_images tool."
         })
 
         # Debug: print prompt (text parts only)
@@ -239,86 +995,42 @@ Respond with ONLY a JSON array:
             self._debug_print("HAIKU PROMPT", f"{prompt_text}\n\n[+ {len(valid_indices)} images]")
 
         try:
-            response = client.messages.create(
+            response = self._call_with_retry(
+                client.messages.create,
                 model="claude-haiku-4-5-20251001",
-                max_tokens=1000,
+                # Each score is an index, a number and one short sentence
+                max_tokens=100 + 80 * len(valid_indices),
+                tools=[_SCORE_IMAGES_TOOL],
+                tool_choice={"type": "tool", "name": _SCORE_IMAGES_TOOL["name"]},
                 messages=[{"role": "user", "content": content}]
             )
 
-            response_text = response.content[0].text.strip()
-            self._debug_print("HAIKU RESPONSE", response_text)
-            
-            # Extract JSON array from response
-            import re
-            match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            if match:
-                scores = json.loads(match.group())
-                
-                # Filter by min_score and attach details to candidates
-                selected = []
-                for item in scores:
-                    idx = item.get("index", -1)
-                    score = item.get("confidence_score", 0)
-                    details = item.get("matched_details", "")
-                    
-                    if score >= min_score and 0 <= idx < len(valid_indices):
-                        candidate = candidates[valid_indices[idx]]
-                        candidate.confidence_score = score
-                        candidate.matched_details = details
-                        selected.append(candidate)
-                        print(f"    Image {idx}: score={score}, {details[:60]}...", file=sys.stderr)
-                
-                # Sort by score descending
-                selected.sort(key=lambda c: c.confidence_score, reverse=True)
-                return selected
-                
-        except Exception as e:
-            print(f"Warning: Selection failed ({e}), using first 3", file=sys.stderr)
-
-        return candidates[:3]
-
-    def _detect_image_format(self, image_data: bytes) -> str:
-        """Detect image format from magic bytes."""
-        if len(image_data) < 12:
-            return ".bin"
-
-        if image_data[:3] == b'\xff\xd8\xff':
-            return ".jpg"
-        elif image_data[:8] == b'\x89PNG\r\n\x1a\n':
-            return ".png"
-        elif image_data[:4] == b'RIFF' and image_data[8:12] == b'WEBP':
-            return ".webp"
-        elif image_data[:4] == b'GIF8':
-            return ".gif"
-        elif image_data[4:12] in (b'ftypavif', b'ftypavis'):
-            return ".avif"
-        elif image_data[4:12] in (b'ftypheic', b'ftypmif1'):
-            return ".heic"
-        return ".bin"
+            tool_use = next(block for block in response.content if block.type == "tool_use")
+            scores = tool_use.input["scores"]
+            self._debug_print("HAIKU RESPONSE", _json_dumps(scores, indent=True))
 
-    def _optimize_image(self, image_data: bytes, max_dimension: int = 3072) -> tuple[Optional[str], Optional[bytes]]:
-        """Optimize image for API processing."""
-        from PIL import Image
+            # Filter by min_score and attach details to candidates
+            selected = []
+            for item in scores:
+                idx = item.get("index", -1)
+                score = item.get("confidence_score", 0)
+                details = item.get("matched_details", "")
 
-        try:
-            img = Image.open(io.BytesIO(image_data))
-            width, height = img.size
+                if score >= min_score and 0 <= idx < len(valid_indices):
+                    candidate = candidates[valid_indices[idx]]
+                    candidate.confidence_score = score
+                    candidate.matched_details = details
+                    selected.append(candidate)
+                    print(f"    Image {idx}: score={score}, {details[:60]}...", file=sys.stderr)
 
-            if max(width, height) > max_dimension:
-                scale = max_dimension / max(width, height)
-                img = img.resize((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+            # Sort by score descending
+            selected.sort(key=lambda c: c.confidence_score, reverse=True)
+            return selected[:max_images]
 
-            buffer = io.BytesIO()
-            if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-                img.save(buffer, format="PNG", optimize=True)
-                return "image/png", buffer.getvalue()
-            else:
-                img = img.convert("RGB")
-                img.save(buffer, format="JPEG", quality=85)
-                return "image/jpeg", buffer.getvalue()
         except Exception as e:
-            print(f"Warning: Image optimization failed ({e})", file=sys.stderr)
-            return None, None
+            print(f"Warning: Selection failed ({e}), using first {max_images}", file=sys.stderr)
+
+        return candidates[:max_images]
 
     def generate_image(
         self,
@@ -326,13 +1038,17 @@ Respond with ONLY a JSON array:
         subject: str,
         style_instructions: str,
         resolution: str,
-        aspect_ratio: str
-    ) -> tuple[list[bytes], dict[str, int], str]:
-        """Step 4: Generate the product image using Gemini."""
-        from google import genai
+        aspect_ratio: str,
+        on_image: Callable[[bytes], None]
+    ) -> tuple[int, dict[str, int], str]:
+        """Step 4: Generate the product image using Gemini.
+
+        The response is streamed; each image is handed to on_image as soon as
+        it arrives instead of being buffered. Returns the image count.
+        """
         from google.genai import types
 
-        client = genai.Client(api_key=self.gemini_key)
+        client = self.gemini_client
 
         parts = []
         
@@ -340,14 +1056,16 @@ Respond with ONLY a JSON array:
         parts.append(types.Part.from_text(text=f"TASK: Generate an image of `{subject}`.\n\nHere are the reference images:"))
 
         # 2. Images (Interleaved)
+        max_dimension = self.GENERATE_MAX_DIMENSION
+        _ensure_optimized(reference_images, (max_dimension,), self.prefer_jpeg)
+
         for i, ref in enumerate(reference_images):
-            if ref.image_data:
-                mime_type, optimized_data = self._optimize_image(ref.image_data)
-                if mime_type and optimized_data:
-                    # Label
-                    parts.append(types.Part.from_text(text=f"\n**Reference Image {i+1}:**"))
-                    # Image
-                    parts.append(types.Part.from_bytes(data=optimized_data, mime_type=mime_type))
+            if max_dimension in ref.optimized:
+                mime_type, optimized_data = ref.optimized[max_dimension]
+                # Label
+                parts.append(types.Part.from_text(text=f"\n**Reference Image {i+1}:**"))
+                # Image
+                parts.append(types.Part.from_bytes(data=optimized_data, mime_type=mime_type))
 
         # 3. Instructions & Style (Final Text Block)
         style_line = f"\n\nApply styling: {style_instructions}" if style_instructions else ""
@@ -389,60 +1107,114 @@ Do not include the subject title text in the image unless explicitly requested."
             
             self._debug_print("GEMINI PARTS STRUCTURE", "\n\n".join(parts_debug) + f"\n\n[config: aspect_ratio={aspect_ratio}, image_size={image_size}]")
 
-        response = client.models.generate_content(
-            model="gemini-3-pro-image-preview",
-            contents=contents,
-            config=config
-        )
-
-        generated_images = []
+        image_count = 0
         text_response = ""
-
-        if response.candidates:
-            for part in response.candidates[0].content.parts:
+        usage_metadata = None
+
+        def open_stream():
+            # The request is only sent on first iteration, so pull the first
+            # chunk here. Later failures are not retried: images already
+            # written would be duplicated.
+            stream = client.models.generate_content_stream(
+                model="gemini-3-pro-image-preview",
+                contents=contents,
+                config=config
+            )
+            first = next(stream, None)
+            return itertools.chain([first] if first is not None else [], stream)
+
+        for chunk in self._call_with_retry(open_stream):
+            if chunk.usage_metadata:
+                usage_metadata = chunk.usage_metadata
+            if not chunk.candidates or not chunk.candidates[0].content:
+                continue
+            for part in chunk.candidates[0].content.parts or []:
                 if part.inline_data:
-                    generated_images.append(part.inline_data.data)
+                    on_image(part.inline_data.data)
+                    image_count += 1
                 if part.text:
                     text_response += part.text
 
-        self._debug_print("GEMINI RESPONSE", f"Generated {len(generated_images)} image(s)\nText: {text_response or '(none)'}")
+        self._debug_print("GEMINI RESPONSE", f"Generated {image_count} image(s)\nText: {text_response or '(none)'}")
 
         token_usage = {"input": 0, "output": 0, "total": 0}
-        if response.usage_metadata:
-            token_usage["input"] = response.usage_metadata.prompt_token_count or 0
-            token_usage["output"] = response.usage_metadata.candidates_token_count or 0
-            token_usage["total"] = response.usage_metadata.total_token_count or 0
-
-        return generated_images, token_usage, text_response
-
-    def save_outputs(
-        self,
-        generated_images: list[bytes],
-        reference_images: list[ImageCandidate],
-        output_dir: str
-    ) -> tuple[list[str], list[str]]:
-        """Step 5: Save generated and reference images."""
-        output_path = Path(output_dir)
-        refs_path = output_path / ".refs"
-        refs_path.mkdir(exist_ok=True)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-        generated_files = []
-        for i, img_data in enumerate(generated_images):
-            filepath = output_path / f"product_{timestamp}_{i}.png"
-            filepath.write_bytes(img_data)
-            generated_files.append(str(filepath))
-
-        ref_files = []
-        for i, ref in enumerate(reference_images):
-            if ref.image_data:
-                ext = self._detect_image_format(ref.image_data)
-                filepath = refs_path / f"ref_{timestamp}_{i}{ext}"
-                filepath.write_bytes(ref.image_data)
-                ref_files.append(str(filepath))
-
-        return generated_files, ref_files
+        if usage_metadata:
+            token_usage["input"] = usage_metadata.prompt_token_count or 0
+            token_usage["output"] = usage_metadata.candidates_token_count or 0
+            token_usage["total"] = usage_metadata.total_token_count or 0
+
+        return image_count, token_usage, text_response
+
+    def _cache_path(self, output_dir: str, query: str) -> Path:
+        """Location of the reference cache index for a query."""
+        digest = hashlib.sha256(query.encode()).hexdigest()[:16]
+        return Path(output_dir) / ".refs" / ".cache" / f"{digest}.json"
+
+    def _cache_get(self, output_dir: str, query: str) -> Optional[list[ImageCandidate]]:
+        """Load cached reference images for a query, or None if missing, stale, or disabled."""
+        if self.cache_ttl_days <= 0:
+            return None
+        index_path = self._cache_path(output_dir, query)
+        try:
+            if time.time() - index_path.stat().st_mtime > self.cache_ttl_days * 86400:
+                return None
+            entries = _json_loads(index_path.read_bytes())
+            return [
+                ImageCandidate(
+                    url=entry["url"],
+                    description=entry["description"],
+                    image_data=(index_path.parent / entry["image_path"]).read_bytes()
+                )
+                for entry in entries
+            ]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @staticmethod
+    def _cache_remove(index_path: Path) -> None:
+        """Delete a cache index and the image files stored beside it."""
+        for path in index_path.parent.glob(f"{index_path.stem}_*"):
+            path.unlink(missing_ok=True)
+        index_path.unlink(missing_ok=True)
+
+    def _cache_prune(self, cache_dir: Path) -> None:
+        """Delete every cache entry older than the TTL."""
+        cutoff = time.time() - self.cache_ttl_days * 86400
+        for index_path in cache_dir.glob("*.json"):
+            try:
+                if index_path.stat().st_mtime < cutoff:
+                    self._cache_remove(index_path)
+            except OSError:
+                pass
+
+    def _cache_put(self, output_dir: str, query: str, candidates: list[ImageCandidate]) -> None:
+        """Store reference images for a query; bytes live beside the index, not inside it.
+
+        Replaces any earlier entry for the query and prunes expired ones. With
+        the cache disabled, the query's entry is only removed, so a later
+        cached run can't bring back references the user chose to refetch.
+        """
+        index_path = self._cache_path(output_dir, query)
+        try:
+            if index_path.parent.is_dir():
+                self._cache_remove(index_path)
+                if self.cache_ttl_days > 0:
+                    self._cache_prune(index_path.parent)
+            if self.cache_ttl_days <= 0:
+                return
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            entries = []
+            for i, candidate in enumerate(candidates):
+                image_path = f"{index_path.stem}_{i}{_detect_image_format(candidate.image_data)}"
+                (index_path.parent / image_path).write_bytes(candidate.image_data)
+                entries.append({
+                    "url": candidate.url,
+                    "description": candidate.description,
+                    "image_path": image_path
+                })
+            index_path.write_text(_json_dumps(entries))
+        except OSError as e:
+            print(f"  Warning: could not write reference cache: {e}", file=sys.stderr)
 
     def run(
         self,
@@ -455,59 +1227,68 @@ Do not include the subject title text in the image unless explicitly requested."
         """Execute the complete image generation workflow."""
 
         # Preflight
-        success, error_msg = self.preflight_check(output_dir)
+        success, error_msg = self.preflight_check(output_dir, validate_live=self.validate_keys)
         if not success:
             return GenerationResult(status="error", message=f"Preflight failed:\n{error_msg}")
 
-        # Step 1: Search
-        print("Step 1/4: Searching for reference images...", file=sys.stderr)
-        candidates = self.search_images(subject)
-        if not candidates:
-            return GenerationResult(
-                status="error",
-                message=f"No reference images found for: '{subject}'"
+        # Steps 1-2: Search and fetch reference images (pipelined), unless cached
+        print("Step 1/3: Searching and fetching reference images...", file=sys.stderr)
+        selected = self._cache_get(output_dir, subject)
+        cache_hit = bool(selected)
+        if cache_hit:
+            print(f"  Using {len(selected)} cached reference images", file=sys.stderr)
+        else:
+            candidates, fetched = asyncio.run(
+                self.search_and_fetch(
+                    subject,
+                    optimize_dimensions=(self.GENERATE_MAX_DIMENSION,),
+                    target_fetches=self.MAX_REFERENCE_IMAGES
+                )
             )
-        print(f"  Found {len(candidates)} candidates", file=sys.stderr)
-
-        # Step 2: Fetch reference images
-        print("Step 2/4: Fetching reference images...", file=sys.stderr)
-        selected = []
-        for candidate in candidates:
-            if len(selected) >= 3:
-                break
-            
-            image_data = self.fetch_image(candidate.url)
-            if image_data:
-                candidate.image_data = image_data
-                selected.append(candidate)
+            if not candidates:
+                return GenerationResult(
+                    status="error",
+                    message=f"No reference images found for: '{subject}'"
+                )
+            print(f"  Found {len(candidates)} candidates", file=sys.stderr)
+
+            selected = fetched[:self.MAX_REFERENCE_IMAGES]
+            for candidate in selected:
                 print(f"  Fetched image from {candidate.url}", file=sys.stderr)
-        
-        if not selected:
-            return GenerationResult(
-                status="error",
-                message="Failed to fetch any reference images"
-            )
-        print(f"  Fetched {len(selected)} images", file=sys.stderr)
-
-        # Step 4: Generate
-        print("Step 3/4: Generating image...", file=sys.stderr)
-        generated_images, token_usage, text_response = self.generate_image(
-            selected,
-            subject,
-            style_instructions,
-            resolution,
-            aspect_ratio
-        )
-        if not generated_images:
-            return GenerationResult(
-                status="error",
-                message=f"Gemini returned no images. Response: {text_response}"
+
+            if not selected:
+                return GenerationResult(
+                    status="error",
+                    message="Failed to fetch any reference images"
+                )
+            print(f"  Fetched {len(selected)} images", file=sys.stderr)
+
+        # Steps 4-5: Generate, writing each image to disk as it streams in
+        print("Step 2/3: Generating image...", file=sys.stderr)
+        with OutputWriter(output_dir, optimize_png=self.optimize_png) as writer:
+            image_count, token_usage, text_response = self.generate_image(
+                selected,
+                subject,
+                style_instructions,
+                resolution,
+                aspect_ratio,
+                on_image=writer.add_generated
             )
-        print(f"  Generated {len(generated_images)} images", file=sys.stderr)
+            if not image_count:
+                return GenerationResult(
+                    status="error",
+                    message=f"Gemini returned no images. Response: {text_response}"
+                )
+            print(f"  Generated {image_count} images", file=sys.stderr)
+
+            print("Step 3/3: Saving reference images...", file=sys.stderr)
+            for ref in selected:
+                writer.add_reference(ref)
+
+        if not cache_hit:
+            self._cache_put(output_dir, subject, selected)
 
-        # Step 5: Save
-        print("Step 4/4: Saving outputs...", file=sys.stderr)
-        generated_files, ref_files = self.save_outputs(generated_images, selected, output_dir)
+        generated_files, ref_files = writer.generated_files, writer.ref_files
 
         return GenerationResult(
             status="success",
@@ -551,6 +1332,32 @@ def main():
         default="assets/generated/",
         help="Output directory (default: assets/generated/)"
     )
+    parser.add_argument(
+        "--optimize-png",
+        action="store_true",
+        help="Losslessly recompress generated PNGs with oxipng (smaller files, slower)"
+    )
+    parser.add_argument(
+        "--cache-ttl-days",
+        type=float,
+        default=ProductStudio.CACHE_TTL_DAYS,
+        help="Reuse reference images cached for the same subject for this many days; 0 refetches and drops the cached entry (default: 7)"
+    )
+    parser.add_argument(
+        "--validate-keys",
+        action="store_true",
+        help="Check each API key against its provider before spending search and fetch quota"
+    )
+    parser.add_argument(
+        "--keep-transparency",
+        action="store_true",
+        help="Send transparent reference images as PNG instead of flattening them to JPEG"
+    )
+    parser.add_argument(
+        "--pretty-output",
+        action="store_true",
+        help="Indent the result JSON for reading (default: compact)"
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -559,7 +1366,13 @@ def main():
 
     args = parser.parse_args()
 
-    studio = ProductStudio(debug=args.debug)
+    studio = ProductStudio(
+        debug=args.debug,
+        optimize_png=args.optimize_png,
+        cache_ttl_days=args.cache_ttl_days,
+        validate_keys=args.validate_keys,
+        prefer_jpeg=not args.keep_transparency
+    )
     result = studio.run(
         subject=args.subject,
         style_instructions=args.style_instructions,
@@ -568,7 +1381,7 @@ def main():
         output_dir=args.output
     )
 
-    print(result.to_json())
+    print(result.to_json(pretty=args.pretty_output))
     sys.exit(0 if result.status == "success" else 1)
 
 